@@ -4,22 +4,47 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import sys
-import glob
 import os
-import colorsys
+from importlib.util import find_spec
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-required_modules = ["pandas", "matplotlib"]
-missing_modules = [m for m in required_modules if __import__("importlib.util").util.find_spec(m) is None]
+required_modules = ["numpy", "pandas", "pyarrow", "matplotlib"]
+missing_modules = [m for m in required_modules if find_spec(m) is None]
 if missing_modules:
     print(f"[compare_logs.py] Error: Missing required Python modules: {', '.join(missing_modules)}")
     print(f"[compare_logs.py] Please install with: python3 -m pip install {' '.join(missing_modules)}")
     sys.exit(1)
 
+import numpy as np
 import pandas as pd
+import matplotlib
+
+SHOW = "--show" in sys.argv
+if not SHOW:
+    matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import hsv_to_rgb
+from matplotlib.lines import Line2D
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 FILTER_PERCENT = "--filter-percent" in sys.argv
 FILTER_IQR = "--filter-iqr" in sys.argv
+EXACT = "--exact" in sys.argv
+DOWNSAMPLE_POINTS = 4000
+
+DPI = 150
+if "--dpi" in sys.argv:
+    try:
+        DPI = int(sys.argv[sys.argv.index("--dpi") + 1])
+    except (IndexError, ValueError):
+        print("[compare_logs.py] Error: --dpi requires an integer value")
+        sys.exit(1)
 
 if FILTER_PERCENT:
     print("[compare_logs.py] Outlier filtering using 1% / 99% percent ENABLED")
@@ -27,7 +52,7 @@ elif FILTER_IQR:
     print("[compare_logs.py] Outlier filtering using IQR ENABLED")
 
 if len(sys.argv) < 2:
-    print("[compare_logs.py] Usage: python3 compare_logs.py <log_folder> [--filter-percent] [--filter-iqr]")
+    print("[compare_logs.py] Usage: python3 compare_logs.py <log_folder> [--filter-percent] [--filter-iqr] [--dpi N] [--show] [--exact]")
     sys.exit(1)
 
 log_base_folder = os.path.expanduser(sys.argv[1])
@@ -42,26 +67,85 @@ metrics = [
     ("gpu_load", "GPU Load (%)", False)
 ]
 
+# Cheap pre-filter for empty or truncated logs; CSVs with a header but no frames
+# are dropped after parsing
+MIN_CSV_SIZE = 128
+
 def get_csv_files(game_folder):
-    files = sorted(glob.glob(os.path.join(game_folder, '**/eden_*.csv'), recursive=True))
-    return [f for f in files if not f.endswith('_summary.csv')]
+    files = []
+    for root, dirs, names in os.walk(game_folder, followlinks=True):
+        # Match glob: follow directory symlinks but skip hidden directories
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in names:
+            if name.startswith('eden_') and name.endswith('.csv') and not name.endswith('_summary.csv'):
+                path = os.path.join(root, name)
+                if os.path.getsize(path) >= MIN_CSV_SIZE:
+                    files.append(path)
+    files.sort()
+    return files
 
 def read_data(file_path):
     csv_dir = os.path.dirname(file_path)
 
-    version_file = os.path.join(csv_dir, "eden-cli-version.txt")
-    name_file = os.path.join(csv_dir, "eden-cli-game-name.txt")
-    id_file = os.path.join(csv_dir, "eden-cli-game-id.txt")
+    with os.scandir(csv_dir) as it:
+        entries = {e.name: e.path for e in it}
+
+    def read_text(name):
+        if name not in entries:
+            return None
+        with open(entries[name]) as f:
+            return f.read().strip()
 
-    version_short = open(version_file).read().strip().split()[0] if os.path.exists(version_file) else "unknown"
-    game_name = open(name_file).read().strip() if os.path.exists(name_file) else os.path.basename(csv_dir)
-    game_id = open(id_file).read().strip() if os.path.exists(id_file) else "unknown"
+    version = read_text("eden-cli-version.txt")
+    version_short = version.split()[0] if version else "unknown"
+    game_name = read_text("eden-cli-game-name.txt") or os.path.basename(csv_dir)
+    game_id = read_text("eden-cli-game-id.txt") or "unknown"
 
     relative_path = os.path.basename(csv_dir)
     build_folder = os.path.basename(os.path.dirname(csv_dir))
 
-    df = pd.read_csv(file_path, skiprows=2)
-    df.columns = df.columns.str.strip()
+    cache_file = file_path + ".parquet"
+    df = None
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(file_path):
+        try:
+            df = pd.read_parquet(cache_file)
+        except (OSError, ValueError) as e:
+            print(f"[compare_logs.py] Ignoring unreadable cache {cache_file}: {e}")
+
+    if df is None:
+        try:
+            header = pd.read_csv(file_path, skiprows=2, nrows=0).columns
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            print(f"[compare_logs.py] Skipping unreadable CSV {file_path}: {e}")
+            return None
+        metric_columns = {col for col, _, _ in metrics}
+        usecols = [c for c in header if c.strip() in metric_columns]
+        if not usecols:
+            print(f"[compare_logs.py] Skipping {file_path}: no metric columns in header")
+            return None
+        try:
+            df = pd.read_csv(file_path, header=2, engine="pyarrow", usecols=usecols,
+                             dtype={c: "float32" for c in usecols}, on_bad_lines="skip")
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            print(f"[compare_logs.py] Skipping unreadable CSV {file_path}: {e}")
+            return None
+        df.columns = df.columns.str.strip()
+        # Write to a temporary file first so an interrupted run never leaves a
+        # truncated cache that looks newer than its CSV
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_file, compression="zstd")
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"[compare_logs.py] Could not write cache {cache_file}: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    for col, _, _ in metrics:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    if df.empty:
+        print(f"[compare_logs.py] Skipping {file_path}: no frames logged")
+        return None
     summary_file = file_path.replace(".csv", "_summary.csv")
 
     return {
@@ -76,54 +160,151 @@ def read_data(file_path):
 
 def build_colors_for_builds(build_folders):
     n = len(build_folders)
-    return {b: colorsys.hsv_to_rgb(i / n, 0.7, 0.9) for i, b in enumerate(build_folders)}
-
-def plot_metric(df, column_name, build_colors, build_folder, relative_path, version_short,
-                summary_file=None, is_fps=False, ax=None):
-    if column_name not in df.columns:
-        return None
-
-    y = df[column_name]
+    hsv = np.stack([np.arange(n) / n, np.full(n, 0.7), np.full(n, 0.9)], axis=1)
+    rgb = hsv_to_rgb(hsv)
+    return dict(zip(build_folders, map(tuple, rgb)))
+
+if njit is not None:
+    @njit("Tuple((float32[:], float64, float64, float64))(float32[:], float64, float64)", cache=True)
+    def stats_and_clip(arr, lower, upper):
+        # Clamp and reduce in a single sweep over the array; NaN cells are left
+        # in place and skipped by the stats, matching pandas' skipna
+        min_val = np.inf
+        max_val = -np.inf
+        total = 0.0
+        count = 0
+        for i in range(arr.shape[0]):
+            v = arr[i]
+            if np.isnan(v):
+                continue
+            v = min(max(v, lower), upper)
+            arr[i] = v
+            min_val = min(min_val, v)
+            max_val = max(max_val, v)
+            total += v
+            count += 1
+        if count == 0:
+            return arr, np.nan, np.nan, np.nan
+        return arr, min_val, max_val, total / count
+else:
+    def stats_and_clip(arr, lower, upper):
+        np.clip(arr, lower, upper, out=arr)
+        finite = arr[~np.isnan(arr)]
+        if finite.size == 0:
+            return arr, np.nan, np.nan, np.nan
+        return arr, float(finite.min()), float(finite.max()), float(finite.mean())
+
+def min_max_mean(arr):
+    # An unbounded clip leaves values untouched, so the unfiltered stats share
+    # stats_and_clip's single sweep and its NaN/empty handling
+    _, min_val, max_val, avg_val = stats_and_clip(arr, -np.inf, np.inf)
+    return min_val, max_val, avg_val
+
+def filter_outliers(arr):
+    # Clips in place, so callers must pass an array they own; returns the array
+    # together with its (min, max, mean)
     if FILTER_PERCENT:
-        lower = y.quantile(0.001)
-        upper = y.quantile(0.999)
-        y = y.clip(lower=lower, upper=upper)
+        lower, upper = np.nanpercentile(arr, [0.1, 99.9])
     elif FILTER_IQR:
-        Q1 = y.quantile(0.25)
-        Q3 = y.quantile(0.75)
+        Q1, Q3 = np.nanpercentile(arr, [25, 75])
         IQR = Q3 - Q1
-        lower = Q1 - 1.5 * IQR
-        upper = Q3 + 1.5 * IQR
-        y = y.clip(lower=lower, upper=upper)
+        lower, upper = Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+    else:
+        return arr, min_max_mean(arr)
+
+    arr, min_val, max_val, avg_val = stats_and_clip(arr, lower, upper)
+    return arr, (min_val, max_val, avg_val)
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keep the first and last points, then from each
+    # bucket pick the point forming the largest triangle with the previously kept
+    # point and the average of the next bucket
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    bucket_size = (n - 2) / (n_out - 2)
+    idx = np.empty(n_out, dtype=np.intp)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+def load_summary(summary_file):
+    try:
+        df_sum = pd.read_csv(summary_file, nrows=1)
+        return {
+            "avg": float(df_sum['Average FPS'][0]),
+            "0.1%": float(df_sum['0.1% Min FPS'][0]),
+            "1%": float(df_sum['1% Min FPS'][0]),
+            "97%": float(df_sum['97% Percentile FPS'][0])
+        }
+    except Exception as e:
+        print(f"[compare_logs.py] Could not read summary for {summary_file}: {e}")
+        return None
+
+def plot_metric(x, y, stats, build_colors, build_folder, relative_path, version_short,
+                summary=None, is_fps=False):
+    if y is None:
+        return None
 
-    x = range(len(y))
-    min_val = y.min()
-    max_val = y.max()
-    avg_val = y.mean()
+    min_val, max_val, avg_val = stats
 
     summary_text = f"{relative_path:<11} | {version_short:<48} | AVG: {avg_val:>5.1f} | Min: {min_val:>5.1f} | Max: {max_val:>5.1f}"
-    if is_fps and summary_file and os.path.exists(summary_file):
-        try:
-            df_sum = pd.read_csv(summary_file)
-            summary_text = (f"{relative_path:<11} | {version_short:<48} | "
-                            f"AVG: {float(df_sum['Average FPS'][0]):>5.1f} | "
-                            f"Min: {min_val:>5.1f} | Max: {max_val:>5.1f} | "
-                            f"0.1%: {float(df_sum['0.1% Min FPS'][0]):>5.1f} | "
-                            f"1%: {float(df_sum['1% Min FPS'][0]):>5.1f} | "
-                            f"97%: {float(df_sum['97% Percentile FPS'][0]):>5.1f}")
-        except Exception as e:
-            print(f"[compare_logs.py] Could not read summary for {summary_file}: {e}")
-
-    ax.plot(x, y, label=summary_text, color=build_colors[build_folder])
-    return summary_text
-
-def process_game_folder(game_folder):
+    if is_fps and summary:
+        summary_text = (f"{relative_path:<11} | {version_short:<48} | "
+                        f"AVG: {summary['avg']:>5.1f} | "
+                        f"Min: {min_val:>5.1f} | Max: {max_val:>5.1f} | "
+                        f"0.1%: {summary['0.1%']:>5.1f} | "
+                        f"1%: {summary['1%']:>5.1f} | "
+                        f"97%: {summary['97%']:>5.1f}")
+
+    segment = np.column_stack([x, y])
+    return segment, build_colors[build_folder], summary_text
+
+def draw_lines(ax, lines):
+    lines = [line for line in lines if line is not None]
+    if not lines:
+        return
+    segments, colors, labels = zip(*lines)
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=1, rasterized=True))
+    ax.autoscale_view()
+    handles = [Line2D([], [], color=c, label=txt) for c, txt in zip(colors, labels)]
+    ax.legend(handles=handles, fontsize=8, loc="lower right")
+
+def process_game_folder(game_folder, show=False):
     csv_files = get_csv_files(game_folder)
     if not csv_files:
         print(f"[compare_logs.py] No CSV files in '{game_folder}', skipping...")
         return
 
-    data = [read_data(f) for f in csv_files]
+    with ThreadPoolExecutor(max_workers=min(8, len(csv_files))) as ex:
+        data = [d for d in ex.map(read_data, csv_files) if d is not None]
+    if not data:
+        print(f"[compare_logs.py] No usable CSV files in '{game_folder}', skipping...")
+        return
+
+    for d in data:
+        d['x'], d['y'], d['stats'] = {}, {}, {}
+        for col, _, _ in metrics:
+            if col in d['df'].columns:
+                y, d['stats'][col] = filter_outliers(d['df'][col].to_numpy(dtype=np.float32, copy=True))
+                x = np.arange(len(y))
+                if not EXACT and len(y) > DOWNSAMPLE_POINTS:
+                    x, y = lttb(x, y, DOWNSAMPLE_POINTS)
+                d['x'][col], d['y'][col] = x, y
+
+    summaries = {d['summary_file']: load_summary(d['summary_file'])
+                 for d in data if os.path.exists(d['summary_file'])}
 
     game_name = data[0]["game_name"]
     game_id = data[0]["game_id"]
@@ -135,50 +316,64 @@ def process_game_folder(game_folder):
     png_suffix = "-filtered-percent" if FILTER_PERCENT else "-filtered-iqr" if FILTER_IQR else ""
     title_filter_label = " (Filtered 1%/99% percent)" if FILTER_PERCENT else " (Filtered IQR)" if FILTER_IQR else ""
 
+    fig, ax = plt.subplots(figsize=(14, 7))
     for column_name, metric_label, is_fps in metrics:
-        plt.figure(figsize=(14, 7))
-        ax = plt.gca()
+        ax.clear()
 
-        for d in data:
+        lines = [
             plot_metric(
-                d['df'], column_name, build_colors, d['build_folder'], d['relative_path'],
-                d['version_short'], summary_file=d['summary_file'] if is_fps else None,
-                is_fps=is_fps, ax=ax
+                d['x'].get(column_name), d['y'].get(column_name), d['stats'].get(column_name), build_colors,
+                d['build_folder'], d['relative_path'], d['version_short'],
+                summary=summaries.get(d['summary_file']) if is_fps else None,
+                is_fps=is_fps
             )
-
-        plt.xlabel("Frame")
-        plt.ylabel(metric_label)
-        plt.title(f"{game_name} ({game_id}) - {metric_label} Comparison Across Builds{title_filter_label}")
-        plt.legend(fontsize=8)
-        plt.grid(True)
-        plt.tight_layout()
+            for d in data
+        ]
+        draw_lines(ax, lines)
+
+        ax.set_xlabel("Frame")
+        ax.set_ylabel(metric_label)
+        ax.set_title(f"{game_name} ({game_id}) - {metric_label} Comparison Across Builds{title_filter_label}")
+        ax.grid(True)
+        fig.tight_layout()
         plots_dir = os.path.join(game_folder, "plots", column_name)
         os.makedirs(plots_dir, exist_ok=True)
-        plt.savefig(os.path.join(plots_dir, f"comparison{png_suffix}.png"), dpi=200)
-        plt.close()
+        fig.savefig(os.path.join(plots_dir, f"comparison{png_suffix}.png"), dpi=DPI)
+    plt.close(fig)
 
-    fig, axs = plt.subplots(len(metrics), 1, figsize=(14, 4*len(metrics)), sharex=True)
-    for d in data:
-        for idx, (col, _, is_fps) in enumerate(metrics):
+    fig, axs = plt.subplots(len(metrics), 1, figsize=(14, 3.2*len(metrics)), sharex=True)
+    for idx, (col, _, is_fps) in enumerate(metrics):
+        lines = [
             plot_metric(
-                d['df'], col, build_colors, d['build_folder'], d['relative_path'],
-                d['version_short'], summary_file=d['summary_file'] if is_fps else None,
-                is_fps=is_fps, ax=axs[idx]
+                d['x'].get(col), d['y'].get(col), d['stats'].get(col), build_colors,
+                d['build_folder'], d['relative_path'], d['version_short'],
+                summary=summaries.get(d['summary_file']) if is_fps else None,
+                is_fps=is_fps
             )
+            for d in data
+        ]
+        draw_lines(axs[idx], lines)
 
     axs[-1].set_xlabel("Frame")
     for idx, (_, metric_label, _) in enumerate(metrics):
         axs[idx].set_ylabel(metric_label)
         axs[idx].grid(True)
-        axs[idx].legend(fontsize=8)
 
     plt.suptitle(f"{game_name} ({game_id}) - Combined Metrics Comparison Across Builds{title_filter_label}")
     plt.tight_layout(rect=[0, 0, 1, 0.97])
     plots_dir = os.path.join(game_folder, "plots", "all_metrics")
     os.makedirs(plots_dir, exist_ok=True)
-    plt.savefig(os.path.join(plots_dir, f"comparison{png_suffix}.png"), dpi=200)
-    plt.show()
-
-for game_folder in sorted(os.path.join(log_base_folder, d) for d in os.listdir(log_base_folder)
-                          if os.path.isdir(os.path.join(log_base_folder, d))):
-    process_game_folder(game_folder)
+    plt.savefig(os.path.join(plots_dir, f"comparison{png_suffix}.png"), dpi=DPI)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+if __name__ == "__main__":
+    with os.scandir(log_base_folder) as it:
+        game_folders = sorted(e.path for e in it if e.is_dir())
+    if SHOW:
+        for game_folder in game_folders:
+            process_game_folder(game_folder, show=True)
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            list(ex.map(process_game_folder, game_folders))